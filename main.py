@@ -2,13 +2,18 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import re
+import tempfile
+import time
 from datetime import timedelta
-from typing import Iterable, List, Optional, Sequence
+from functools import lru_cache
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from dotenv import load_dotenv
+import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import commands
@@ -46,6 +51,18 @@ TEACHER_ROLE_ID: int = _env_int("DISCORD_TEACHER_ROLE_ID", 1436197056992645120)
 MAX_TIMEOUT_SECONDS = 60 * 60 * 24 * 28
 # Datei-Uploads koennen je nach Server-Limit variieren – 25 MB ist Standard fuer Nitro-lose Server.
 MAX_FILE_UPLOAD_BYTES = 25 * 1024 * 1024
+# Anhaenge werden blockweise geladen und erst ab dieser Groesse auf die Platte ausgelagert.
+ATTACHMENT_CHUNK_BYTES = 64 * 1024
+ATTACHMENT_SPOOL_BYTES = 1024 * 1024
+# Bulk-Delete: maximal 100 Nachrichten pro Aufruf, nur juenger als 14 Tage (mit etwas Puffer).
+BULK_DELETE_MAX_MESSAGES = 100
+BULK_DELETE_MAX_AGE = timedelta(days=13, hours=23)
+# Parallele fetch_member-Aufrufe begrenzen, um nicht in Discords Rate-Limit zu laufen.
+MEMBER_FETCH_CONCURRENCY = 5
+# Wie lange unbekannte Mitglieds-IDs nicht erneut abgefragt werden.
+MISSING_MEMBER_TTL_SECONDS = 300
+# Parallele Rollen-Aenderungen begrenzen (Discord limitiert pro Route recht streng).
+ROLE_UPDATE_CONCURRENCY = 3
 
 # ---------------------------------------------------------------------------
 
@@ -55,23 +72,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger("farning_bot")
 
+KURS_LOGS_CHANNEL_NAME = "kurs-logs"
 TIME_MULTIPLIERS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
-MENTION_PATTERN = re.compile(r"<@!?(\d+)>")
+# Erwaehnung (<@123>, <@!123>) oder freistehende ID zwischen Kommas/Leerzeichen.
+MEMBER_ID_PATTERN = re.compile(r"<@!?(\d+)>|(?<![^,\s])(\d+)(?![^,\s])")
+SLUG_INVALID_PATTERN = re.compile(r"[^a-z0-9-]")
 
 intents = discord.Intents.default()
 intents.guilds = True
 intents.members = True
 intents.messages = True
 
+# Kein Member-Chunking beim Start: nur Mitglieder cachen, die waehrend der Laufzeit beitreten.
+# Alle anderen werden bei Bedarf per fetch_member nachgeladen (siehe _resolve_members).
+member_cache_flags = discord.MemberCacheFlags.none()
+member_cache_flags.joined = True
+
 
 class FarningBot(commands.Bot):
     """Bot mit eigenem setup_hook zum Synchronisieren der Slash-Befehle."""
 
     def __init__(self) -> None:
-        super().__init__(command_prefix="!", intents=intents)
+        super().__init__(
+            command_prefix="!",
+            intents=intents,
+            chunk_guilds_at_startup=False,
+            member_cache_flags=member_cache_flags,
+        )
+        self.http_session: Optional[aiohttp.ClientSession] = None
 
     async def setup_hook(self) -> None:  # noqa: D401
         """Sync der Slash-Commands sobald der Bot startet."""
+        self.http_session = aiohttp.ClientSession()
         if GUILD_ID:
             guild_obj = discord.Object(id=GUILD_ID)
             self.tree.copy_global_to(guild=guild_obj)
@@ -81,12 +113,28 @@ class FarningBot(commands.Bot):
             await self.tree.sync()
             logger.info("Slash-Befehle global synchronisiert (keine GUILD_ID gesetzt)")
 
+    async def close(self) -> None:
+        if self.http_session is not None:
+            await self.http_session.close()
+        await super().close()
+
 
 bot = FarningBot()
 
+# Kursrollen je Gilde, indiziert nach casefold-Namen (gepflegt ueber Gateway-Events).
+_course_role_index: Dict[int, Dict[str, discord.Role]] = {}
+# (Gilde, Mitglied) -> Ablaufzeitpunkt fuer IDs, die zuletzt 404 geliefert haben.
+_missing_members: Dict[Tuple[int, int], float] = {}
+_member_fetch_semaphore = asyncio.Semaphore(MEMBER_FETCH_CONCURRENCY)
+_role_update_semaphore = asyncio.Semaphore(ROLE_UPDATE_CONCURRENCY)
+# Gilde -> ID des kurs-logs Kanals (None = gesucht, aber nicht vorhanden).
+_logs_channel_cache: Dict[int, Optional[int]] = {}
+
 
 def _member_has_role(member: discord.Member, role_id: int) -> bool:
-    return bool(role_id) and any(role.id == role_id for role in getattr(member, "roles", []))
+    # Member._roles ist discord.py's sortierte SnowflakeList der Rollen-IDs: has() per Bisektion,
+    # ohne fuer jeden Check Role-Objekte ueber member.roles aufzubauen.
+    return bool(role_id) and member._roles.has(role_id)
 
 
 def _member_has_any_role(member: discord.Member, role_ids: Iterable[int]) -> bool:
@@ -102,90 +150,198 @@ def _normalize_course_name(name: str) -> str:
     return " ".join(name.strip().split())
 
 
+@lru_cache(maxsize=512)
 def _slugify(name: str) -> str:
     slug = name.strip().lower().replace(" ", "-")
-    return re.sub(r"[^a-z0-9-]", "-", slug)[:90] or "kurs"
+    return SLUG_INVALID_PATTERN.sub("-", slug)[:90] or "kurs"
 
 
-async def _fetch_course_role(guild: discord.Guild, kurs_name: str) -> Optional[discord.Role]:
-    name = _normalize_course_name(kurs_name).casefold()
-    return discord.utils.find(lambda r: r.name.casefold() == name, guild.roles)  # type: ignore[arg-type]
+def _index_course_roles(guild: discord.Guild) -> Dict[str, discord.Role]:
+    index: Dict[str, discord.Role] = {}
+    for role in guild.roles:
+        index.setdefault(role.name.casefold(), role)
+    _course_role_index[guild.id] = index
+    return index
 
 
-def _require_moderator():
-    async def predicate(interaction: discord.Interaction) -> bool:
-        user = interaction.user
-        if isinstance(user, discord.Member):
-            perms = user.guild_permissions
-            if perms.administrator or perms.manage_guild or perms.moderate_members:
-                return True
-            if _member_has_role(user, MODERATOR_ROLE_ID):
-                return True
-        raise app_commands.CheckFailure("Dir fehlen die Moderationsrechte.")
+def _index_role(role: discord.Role) -> None:
+    index = _course_role_index.get(role.guild.id)
+    if index is not None:
+        index.setdefault(role.name.casefold(), role)
 
-    return app_commands.check(predicate)
 
+def _unindex_role(role: discord.Role) -> None:
+    index = _course_role_index.get(role.guild.id)
+    if index is None:
+        return
+    key = role.name.casefold()
+    current = index.get(key)
+    if current is None or current.id != role.id:
+        return
+    # Eine andere Rolle mit gleichem Namen kann nachruecken (alter find-Scan fand sie auch).
+    for other in role.guild.roles:
+        if other.id != role.id and other.name.casefold() == key:
+            index[key] = other
+            return
+    del index[key]
 
-def _require_course_staff():
-    async def predicate(interaction: discord.Interaction) -> bool:
-        user = interaction.user
-        if isinstance(user, discord.Member):
-            perms = user.guild_permissions
-            if perms.administrator or perms.manage_guild:
-                return True
-            if _member_has_any_role(user, (MODERATOR_ROLE_ID, TEACHER_ROLE_ID)):
-                return True
-        raise app_commands.CheckFailure("Nur Moderator:innen oder Lehrer:innen duerfen das tun.")
 
-    return app_commands.check(predicate)
+async def _fetch_course_role(guild: discord.Guild, kurs_name: str) -> Optional[discord.Role]:
+    index = _course_role_index.get(guild.id)
+    if index is None:
+        index = _index_course_roles(guild)
+    return index.get(_normalize_course_name(kurs_name).casefold())
+
+
+async def _moderator_check(interaction: discord.Interaction) -> bool:
+    user = interaction.user
+    if isinstance(user, discord.Member):
+        perms = user.guild_permissions
+        if perms.administrator or perms.manage_guild or perms.moderate_members:
+            return True
+        if _member_has_role(user, MODERATOR_ROLE_ID):
+            return True
+    raise app_commands.CheckFailure("Dir fehlen die Moderationsrechte.")
+
+
+async def _course_staff_check(interaction: discord.Interaction) -> bool:
+    user = interaction.user
+    if isinstance(user, discord.Member):
+        perms = user.guild_permissions
+        if perms.administrator or perms.manage_guild:
+            return True
+        if _member_has_any_role(user, (MODERATOR_ROLE_ID, TEACHER_ROLE_ID)):
+            return True
+    raise app_commands.CheckFailure("Nur Moderator:innen oder Lehrer:innen duerfen das tun.")
 
 
 def _extract_member_ids(raw: str) -> Sequence[int]:
-    ids = {int(match.group(1)) for match in MENTION_PATTERN.finditer(raw)}
-    for chunk in re.split(r"[,\s]+", raw):
-        if chunk.isdigit():
-            ids.add(int(chunk))
-    return list(ids)
+    # Ohne Ziffer kann weder eine Erwaehnung noch eine ID vorkommen - Regex sparen.
+    if not any(ch.isdigit() for ch in raw):
+        return []
+    # dict.fromkeys entfernt Duplikate und behaelt die Eingabereihenfolge bei.
+    return list(dict.fromkeys(int(match.group(1) or match.group(2)) for match in MEMBER_ID_PATTERN.finditer(raw)))
 
 
 def _parse_embed_color(raw: Optional[str]) -> discord.Color:
     if not raw:
         return discord.Color.blurple()
     cleaned = raw.strip().lower()
-    if cleaned.startswith("#"):
-        cleaned = cleaned[1:]
-    if len(cleaned) not in (3, 6):
-        raise ValueError("Hexfarbe muss 3 oder 6 Zeichen lang sein.")
-    if len(cleaned) == 3:
-        cleaned = "".join(ch * 2 for ch in cleaned)
-    if not re.fullmatch(r"[0-9a-f]{6}", cleaned):
-        raise ValueError("Hexfarbe enthaelt ungueltige Zeichen.")
-    return discord.Color(int(cleaned, 16))
+    if cleaned.startswith("rgb"):
+        hex_digits = None
+    elif cleaned.startswith("0x"):
+        hex_digits = cleaned[2:].removeprefix("#")
+    else:
+        hex_digits = cleaned.removeprefix("#")
+        cleaned = f"#{hex_digits}"
+    if hex_digits is not None:
+        # from_str nimmt jede Laenge (#1 -> #000001); Tippfehler sollen aber abgelehnt werden.
+        if len(hex_digits) not in (3, 6):
+            raise ValueError("Hexfarbe muss 3 oder 6 Zeichen lang sein.")
+        # int(x, 16) hinter from_str wuerde auch Leerzeichen, "+", "_" oder Unicode-Ziffern akzeptieren.
+        if not (hex_digits.isascii() and hex_digits.isalnum()):
+            raise ValueError("Hexfarbe enthaelt ungueltige Zeichen.")
+    try:
+        return discord.Color.from_str(cleaned)
+    except ValueError as exc:
+        if hex_digits is not None:
+            raise ValueError("Hexfarbe enthaelt ungueltige Zeichen.") from exc
+        raise ValueError("Ungueltige Farbe - bitte Hex wie #ff8800 oder #f80 angeben.") from exc
+
+
+async def _with_semaphore(semaphore: asyncio.Semaphore, coro: Awaitable[Any]) -> Any:
+    async with semaphore:
+        return await coro
+
+
+def _is_known_missing(guild: discord.Guild, member_id: int, now: float) -> bool:
+    key = (guild.id, member_id)
+    expires_at = _missing_members.get(key)
+    if expires_at is None:
+        return False
+    if expires_at <= now:
+        del _missing_members[key]
+        return False
+    return True
+
+
+def _remember_missing(guild: discord.Guild, member_ids: Iterable[int]) -> None:
+    now = time.monotonic()
+    # Abgelaufene Eintraege beim Einfuegen entfernen, sonst waechst das Dict unbegrenzt.
+    for key in [key for key, expires_at in _missing_members.items() if expires_at <= now]:
+        del _missing_members[key]
+    expires_at = now + MISSING_MEMBER_TTL_SECONDS
+    for member_id in member_ids:
+        _missing_members[(guild.id, member_id)] = expires_at
 
 
 async def _resolve_members(guild: discord.Guild, members_input: str) -> List[discord.Member]:
+    if not members_input.strip():
+        return []
     ids = _extract_member_ids(members_input)
-    resolved: List[discord.Member] = []
+    if not ids:
+        return []
+    resolved: Dict[int, discord.Member] = {}
+    to_fetch: List[int] = []
+    now = time.monotonic()
     for member_id in ids:
         member = guild.get_member(member_id)
-        if member is None:
-            try:
-                member = await guild.fetch_member(member_id)
-            except discord.NotFound:
-                logger.warning("Mitglied %s nicht gefunden", member_id)
-                continue
-        resolved.append(member)
-    return resolved
+        if member is not None:
+            resolved[member.id] = member
+        elif _is_known_missing(guild, member_id, now):
+            logger.warning("Mitglied %s nicht gefunden (zwischengespeichert)", member_id)
+        else:
+            to_fetch.append(member_id)
+
+    if not to_fetch:
+        return list(resolved.values())
+
+    results = await asyncio.gather(
+        *(_with_semaphore(_member_fetch_semaphore, guild.fetch_member(member_id)) for member_id in to_fetch),
+        return_exceptions=True,
+    )
+    missing: List[int] = []
+    for member_id, result in zip(to_fetch, results):
+        if isinstance(result, discord.NotFound):
+            logger.warning("Mitglied %s nicht gefunden", member_id)
+            missing.append(member_id)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            resolved[result.id] = result
+    if missing:
+        _remember_missing(guild, missing)
+    # Eindeutig nach Mitglieds-ID, in der Reihenfolge der Eingabe.
+    return [resolved[member_id] for member_id in ids if member_id in resolved]
 
 
 def _parse_duration(duration: str) -> Optional[int]:
     cleaned = duration.strip().lower()
-    match = re.fullmatch(r"(\d+)([smhd])?", cleaned)
-    if not match:
+    end = 0
+    value = 0
+    while end < len(cleaned) and "0" <= cleaned[end] <= "9":
+        value = value * 10 + (ord(cleaned[end]) - 48)
+        end += 1
+    if end == 0:
         return None
-    value = int(match.group(1))
-    unit = match.group(2) or "m"
-    return value * TIME_MULTIPLIERS[unit]
+    multiplier = TIME_MULTIPLIERS.get(cleaned[end:] or "m")
+    if multiplier is None:
+        return None
+    return value * multiplier
+
+
+def _course_channel_overwrites(
+    guild: discord.Guild, kurs_role: discord.Role
+) -> Dict[discord.Role, discord.PermissionOverwrite]:
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(view_channel=False),
+        kurs_role: discord.PermissionOverwrite(view_channel=True),
+    }
+    for role_id in (MODERATOR_ROLE_ID, TEACHER_ROLE_ID):
+        staff_role = guild.get_role(role_id)
+        if staff_role:
+            overwrites[staff_role] = discord.PermissionOverwrite(view_channel=True, manage_messages=True)
+    return overwrites
 
 
 async def _get_course_category(guild: discord.Guild) -> discord.CategoryChannel:
@@ -198,10 +354,44 @@ async def _get_course_category(guild: discord.Guild) -> discord.CategoryChannel:
 
 
 def _get_kurs_logs_channel(guild: discord.Guild) -> Optional[discord.TextChannel]:
-    """Suche nach dem kurs-logs Kanal (case-insensitiv)."""
-    return discord.utils.find(
-        lambda ch: isinstance(ch, discord.TextChannel) and ch.name.casefold() == "kurs-logs",
-        guild.text_channels,
+    """Suche nach dem kurs-logs Kanal, Ergebnis wird pro Gilde gecacht."""
+    if guild.id in _logs_channel_cache:
+        channel_id = _logs_channel_cache[guild.id]
+        if channel_id is None:
+            return None
+        channel = guild.get_channel(channel_id)
+        if isinstance(channel, discord.TextChannel):
+            return channel
+
+    # Discord speichert Textkanal-Namen immer kleingeschrieben, ein exakter Vergleich genuegt.
+    channel = discord.utils.get(guild.text_channels, name=KURS_LOGS_CHANNEL_NAME)
+    _logs_channel_cache[guild.id] = channel.id if channel else None
+    return channel
+
+
+def _is_kurs_logs_name(channel: discord.abc.GuildChannel) -> bool:
+    return channel.name.casefold() == KURS_LOGS_CHANNEL_NAME
+
+
+async def _download_attachment(attachment: discord.Attachment) -> discord.File:
+    """Laedt einen Anhang blockweise herunter, grosse Dateien landen auf der Platte statt im RAM."""
+    if bot.http_session is None:
+        raise RuntimeError("HTTP-Session ist noch nicht initialisiert.")
+    buffer = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_BYTES)
+    try:
+        async with bot.http_session.get(attachment.url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(ATTACHMENT_CHUNK_BYTES):
+                buffer.write(chunk)
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return discord.File(
+        buffer,
+        filename=attachment.filename,
+        spoiler=attachment.is_spoiler(),
+        description=attachment.description,
     )
 
 
@@ -337,6 +527,63 @@ class RegistrationLogView(discord.ui.View):
 @bot.event
 async def on_ready() -> None:
     logger.info("Bot eingeloggt als %s (ID %s)", bot.user, bot.user.id if bot.user else "?")
+    # Nach einem Reconnect werden verpasste Kanal-Events nicht nachgeliefert.
+    _logs_channel_cache.clear()
+    for guild in bot.guilds:
+        _index_course_roles(guild)
+
+
+@bot.event
+async def on_guild_join(guild: discord.Guild) -> None:
+    _index_course_roles(guild)
+
+
+@bot.event
+async def on_guild_available(guild: discord.Guild) -> None:
+    # Nach einem Gilden-Ausfall baut discord.py neue Role-Objekte, verpasste Events kommen nicht nach.
+    _index_course_roles(guild)
+    _logs_channel_cache.pop(guild.id, None)
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild) -> None:
+    _course_role_index.pop(guild.id, None)
+    _logs_channel_cache.pop(guild.id, None)
+
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel) -> None:
+    if _is_kurs_logs_name(channel):
+        _logs_channel_cache.pop(channel.guild.id, None)
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel) -> None:
+    if _is_kurs_logs_name(channel) or _logs_channel_cache.get(channel.guild.id) == channel.id:
+        _logs_channel_cache.pop(channel.guild.id, None)
+
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+    if _is_kurs_logs_name(before) or _is_kurs_logs_name(after):
+        _logs_channel_cache.pop(after.guild.id, None)
+
+
+@bot.event
+async def on_guild_role_create(role: discord.Role) -> None:
+    _index_role(role)
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role) -> None:
+    _unindex_role(role)
+
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role) -> None:
+    if before.name != after.name:
+        _unindex_role(before)
+        _index_role(after)
 
 
 @bot.tree.command(name="register", description="Registriert Kursdaten im Kurs-Log.")
@@ -355,7 +602,7 @@ async def register(interaction: discord.Interaction) -> None:
 
 
 @bot.tree.command(name="timeout", description="Setzt ein Mitglied fuer eine Zeitspanne auf Timeout.")
-@_require_moderator()
+@app_commands.check(_moderator_check)
 @app_commands.describe(
     member="Mitglied, das stummgeschaltet werden soll",
     dauer="Dauer z.B. 30m, 2h oder 7d (Standard: Minuten)",
@@ -393,7 +640,7 @@ async def timeout(
 
 
 @bot.tree.command(name="kick", description="Wirft ein Mitglied vom Server.")
-@_require_moderator()
+@app_commands.check(_moderator_check)
 @app_commands.describe(member="Mitglied, das gekickt werden soll", reason="Optionaler Grund")
 async def kick(
     interaction: discord.Interaction,
@@ -409,7 +656,7 @@ async def kick(
 
 
 @bot.tree.command(name="ban", description="Bannt ein Mitglied vom Server.")
-@_require_moderator()
+@app_commands.check(_moderator_check)
 @app_commands.describe(member="Mitglied, das gebannt werden soll", reason="Optionaler Grund")
 async def ban(
     interaction: discord.Interaction,
@@ -425,7 +672,7 @@ async def ban(
 
 
 @bot.tree.command(name="clear-chat", description="Loescht eine Anzahl Nachrichten in diesem Kanal.")
-@_require_moderator()
+@app_commands.check(_moderator_check)
 @app_commands.describe(anzahl="Anzahl Nachrichten (max. 200)", reason="Optionaler Grund")
 async def clear_chat(
     interaction: discord.Interaction,
@@ -438,12 +685,27 @@ async def clear_chat(
         return
 
     await interaction.response.defer(ephemeral=True)
-    deleted = await channel.purge(limit=anzahl, reason=_format_reason(interaction, reason))
-    await interaction.followup.send(f"{len(deleted)} Nachrichten geloescht.", ephemeral=True)
+    audit_reason = _format_reason(interaction, reason)
+    if anzahl > BULK_DELETE_MAX_MESSAGES:
+        deleted = await channel.purge(limit=anzahl, reason=audit_reason)
+        await interaction.followup.send(f"{len(deleted)} Nachrichten geloescht.", ephemeral=True)
+        return
+
+    # Ein History-Abruf + ein Bulk-Delete; aeltere Nachrichten wuerde Discord nur einzeln loeschen.
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    messages = [message async for message in channel.history(limit=anzahl)]
+    recent = [message for message in messages if message.created_at > cutoff]
+    await channel.delete_messages(recent, reason=audit_reason)
+
+    summary = f"{len(recent)} Nachrichten geloescht."
+    skipped = len(messages) - len(recent)
+    if skipped:
+        summary += f" {skipped} Nachricht(en) sind aelter als 14 Tage und wurden uebersprungen."
+    await interaction.followup.send(summary, ephemeral=True)
 
 
 @bot.tree.command(name="create-kurs", description="Erstellt einen Kurs-Kanal plus Rolle.")
-@_require_course_staff()
+@app_commands.check(_course_staff_check)
 @app_commands.describe(name="Name des Kurses", reason="Optionaler Grund fuer die Erstellung")
 async def create_kurs(
     interaction: discord.Interaction,
@@ -472,28 +734,18 @@ async def create_kurs(
         await interaction.followup.send(str(exc), ephemeral=True)
         return
 
+    audit_reason = _format_reason(interaction, reason)
     kurs_role = await guild.create_role(
         name=kurs_name,
         mentionable=True,
-        reason=_format_reason(interaction, reason),
+        reason=audit_reason,
     )
 
-    overwrites = {
-        guild.default_role: discord.PermissionOverwrite(view_channel=False),
-        kurs_role: discord.PermissionOverwrite(view_channel=True),
-    }
-    mod_role = guild.get_role(MODERATOR_ROLE_ID)
-    teacher_role = guild.get_role(TEACHER_ROLE_ID)
-    if mod_role:
-        overwrites[mod_role] = discord.PermissionOverwrite(view_channel=True, manage_messages=True)
-    if teacher_role:
-        overwrites[teacher_role] = discord.PermissionOverwrite(view_channel=True, manage_messages=True)
-
     channel = await guild.create_text_channel(
         name=_slugify(kurs_name),
         category=category,
-        overwrites=overwrites,
-        reason=_format_reason(interaction, reason),
+        overwrites=_course_channel_overwrites(guild, kurs_role),
+        reason=audit_reason,
     )
 
     await interaction.followup.send(
@@ -503,7 +755,7 @@ async def create_kurs(
 
 
 @bot.tree.command(name="add-member", description="Fuegt Mitglieder zu einem Kurs hinzu.")
-@_require_course_staff()
+@app_commands.check(_course_staff_check)
 @app_commands.describe(
     kurs_name="Exakter Rollenname des Kurses",
     members="Mitglieder als Erwaehnungen oder IDs (mehrere mit Leerzeichen/Komma trennen)",
@@ -531,15 +783,23 @@ async def add_member(
         return
 
     await interaction.response.defer(ephemeral=True)
+    audit_reason = _format_reason(interaction, reason)
+    targets = [member for member in resolved if kurs_role not in member.roles]
+    results = await asyncio.gather(
+        *(
+            _with_semaphore(_role_update_semaphore, member.add_roles(kurs_role, reason=audit_reason))
+            for member in targets
+        ),
+        return_exceptions=True,
+    )
     updated = []
-    for member in resolved:
-        if kurs_role in member.roles:
-            continue
-        try:
-            await member.add_roles(kurs_role, reason=_format_reason(interaction, reason))
-            updated.append(member.display_name)
-        except discord.Forbidden:
+    for member, result in zip(targets, results):
+        if isinstance(result, discord.Forbidden):
             logger.warning("Rolle konnte nicht an %s vergeben werden (fehlende Berechtigung)", member)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            updated.append(member.display_name)
 
     if updated:
         await interaction.followup.send(
@@ -551,7 +811,7 @@ async def add_member(
 
 
 @bot.tree.command(name="remove-member", description="Entfernt Mitglieder aus einem Kurs.")
-@_require_course_staff()
+@app_commands.check(_course_staff_check)
 @app_commands.describe(
     kurs_name="Exakter Rollenname des Kurses",
     members="Mitglieder als Erwaehnungen oder IDs",
@@ -579,15 +839,23 @@ async def remove_member(
         return
 
     await interaction.response.defer(ephemeral=True)
+    audit_reason = _format_reason(interaction, reason)
+    targets = [member for member in resolved if kurs_role in member.roles]
+    results = await asyncio.gather(
+        *(
+            _with_semaphore(_role_update_semaphore, member.remove_roles(kurs_role, reason=audit_reason))
+            for member in targets
+        ),
+        return_exceptions=True,
+    )
     removed = []
-    for member in resolved:
-        if kurs_role not in member.roles:
-            continue
-        try:
-            await member.remove_roles(kurs_role, reason=_format_reason(interaction, reason))
-            removed.append(member.display_name)
-        except discord.Forbidden:
+    for member, result in zip(targets, results):
+        if isinstance(result, discord.Forbidden):
             logger.warning("Rolle konnte nicht von %s entfernt werden (fehlende Berechtigung)", member)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            removed.append(member.display_name)
 
     if removed:
         await interaction.followup.send(
@@ -623,10 +891,16 @@ async def upload_file(
 
     await interaction.response.defer(ephemeral=True, thinking=True)
     try:
-        discord_file = await attachment.to_file(spoiler=attachment.is_spoiler())
-        content = (message or "").strip() or None
-        await channel.send(content=content, file=discord_file)
-    except (discord.HTTPException, discord.Forbidden) as exc:
+        discord_file = await _download_attachment(attachment)
+        try:
+            content = (message or "").strip() or None
+            await channel.send(content=content, file=discord_file)
+        finally:
+            # discord.File schliesst fremde Dateiobjekte nicht selbst (_owner=False);
+            # File.close() stellt fp.close wieder her, danach Temp-Datei freigeben.
+            discord_file.close()
+            discord_file.fp.close()
+    except (discord.HTTPException, discord.Forbidden, aiohttp.ClientError) as exc:
         logger.exception("Datei konnte nicht hochgeladen werden: %s", exc)
         await interaction.followup.send("Die Datei konnte nicht gesendet werden.", ephemeral=True)
         return
@@ -721,6 +995,12 @@ async def create_embed(
 
 
 def main() -> None:
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("uvloop nicht installiert, nutze Standard-Eventloop")
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     bot.run(TOKEN)
 
 